@@ -1,51 +1,224 @@
 """
 Chapter One -- Intro to Design Patterns
 """
+from array import array
+import atexit
+from collections import Counter
+import importlib
+import json
+import mmap
+import os
+import struct
+import sys
+import weakref
+
+
+# -----------------
+# Output sinks
+# -----------------
+class SinkBase(object):
+    """
+    Where the duck behaviors send their output
+    """
+    def write(self, message):
+        raise NotImplementedError
+
+    def write_many(self, message, count):
+        """
+        Write the same message count times
+        """
+        for _ in range(count):
+            self.write(message)
+
+    def flush(self):
+        pass
+
+
+class PrintSink(SinkBase):
+    def write(self, message):
+        print(message)
+
+    def write_many(self, message, count):
+        if count:
+            print('\n'.join([message] * count))
+
+
+class BufferedSink(SinkBase):
+    """
+    Collect messages and write them to the stream in batches.
+    Whatever is still buffered when the interpreter exits is flushed then.
+    """
+    def __init__(self, stream=None, batch_size=1000):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.buffer = []
+        _buffered_sinks.add(self)
+
+    def write(self, message):
+        self.buffer.append(message)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, message, count):
+        self.buffer.extend([message] * count)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            stream = self.stream or sys.stdout
+            stream.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+
+
+_buffered_sinks = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_buffered_sinks():
+    for sink in list(_buffered_sinks):
+        sink.flush()
+
+
+class CollectingSink(SinkBase):
+    """
+    Keep every message in memory
+    """
+    def __init__(self):
+        self.messages = []
+
+    def write(self, message):
+        self.messages.append(message)
+
+    def write_many(self, message, count):
+        self.messages.extend([message] * count)
+
+
+class NullSink(SinkBase):
+    def write(self, message):
+        pass
+
+    def write_many(self, message, count):
+        pass
+
+
+_sink = PrintSink()
+
+
+def get_sink():
+    return _sink
+
+
+def set_sink(sink):
+    """
+    Send all duck output to sink, flushing the old one first
+    :return: the previous sink
+    """
+    global _sink
+    previous, _sink = _sink, sink
+    previous.flush()
+    return previous
+
 
 # -----------------
 # Flying interfaces
 # -----------------
 class FlyBehaviorMixinBase(object):
+    __slots__ = ()
+
+    # what the behavior writes, if it always writes the same thing
+    message = None
+
     def fly(self):
-        raise NotImplementedError
+        if self.message is None:
+            raise NotImplementedError
+        _sink.write(self.message)
+
+    def fly_many(self, count):
+        """
+        Fly count times in one call (for a whole group of ducks).
+        Behaviors with their own fly() are called once per duck.
+        """
+        if self.message is not None and type(self).fly is FlyBehaviorMixinBase.fly:
+            _sink.write_many(self.message, count)
+        else:
+            for _ in range(count):
+                self.fly()
 
 
 class FlyWithWingsMixin(FlyBehaviorMixinBase):
-    def fly(self):
-        print("I'm flying!")
+    __slots__ = ()
+    message = "I'm flying!"
 
 
 class FlyNoWayMixin(FlyBehaviorMixinBase):
-    def fly(self):
-        print("I can't fly")
+    __slots__ = ()
+    message = "I can't fly"
 
 
 class FlyRocketPoweredMixin(FlyBehaviorMixinBase):
-    def fly(self):
-        print("I'm flying in a rocket!")
+    __slots__ = ()
+    message = "I'm flying in a rocket!"
 
 
 # -------------------
 # Quacking interfaces
 # -------------------
 class QuackBehaviorMixinBase(object):
+    __slots__ = ()
+
+    # what the behavior writes, if it always writes the same thing
+    message = None
+
     def quack(self):
-        raise NotImplementedError
+        if self.message is None:
+            raise NotImplementedError
+        _sink.write(self.message)
+
+    def quack_many(self, count):
+        """
+        Quack count times in one call (for a whole group of ducks).
+        Behaviors with their own quack() are called once per duck.
+        """
+        if self.message is not None and type(self).quack is QuackBehaviorMixinBase.quack:
+            _sink.write_many(self.message, count)
+        else:
+            for _ in range(count):
+                self.quack()
 
 
 class QuackMixin(QuackBehaviorMixinBase):
-    def quack(self):
-        print("quack!")
+    __slots__ = ()
+    message = "quack!"
 
 
 class MuteQuackMixin(QuackBehaviorMixinBase):
-    def quack(self):
-        print('<< silence >>')
+    __slots__ = ()
+    message = '<< silence >>'
 
 
 class SqueakMixin(QuackBehaviorMixinBase):
-    def quack(self):
-        print('squeak!')
+    __slots__ = ()
+    message = 'squeak!'
+
+
+# ------------------
+# Behavior registry
+# ------------------
+# The behaviors don't hold any state, so every duck can share
+# one instance of each behavior class (flyweight).
+_behavior_registry = {}
+
+
+def get_behavior(behavior_cls):
+    """
+    Return the shared instance of behavior_cls, creating it on first use
+    """
+    try:
+        return _behavior_registry[behavior_cls]
+    except KeyError:
+        behavior = _behavior_registry[behavior_cls] = behavior_cls()
+        return behavior
 
 
 # -----------------
@@ -72,7 +245,7 @@ class DuckABC(object):
         self.quack_behavior.quack()
 
     def swim(self):
-        print("All ducks can swim!")
+        _sink.write("All ducks can swim!")
 
 
 class MallardDuck(DuckABC):
@@ -94,9 +267,11 @@ class Duck(object):
     """
     Base class representing a generic duck
     """
+    __slots__ = ('_fly_behavior', '_quack_behavior')
+
     def __init__(self, quack_behavior_cls, fly_behavior_cls):
-        self._fly_behavior = fly_behavior_cls()
-        self._quack_behavior = quack_behavior_cls()
+        self._fly_behavior = get_behavior(fly_behavior_cls)
+        self._quack_behavior = get_behavior(quack_behavior_cls)
 
     @property
     def fly_behavior(self):
@@ -104,7 +279,7 @@ class Duck(object):
 
     @fly_behavior.setter
     def fly_behavior(self, new_behavior_cls):
-        self._fly_behavior = new_behavior_cls()
+        self._fly_behavior = get_behavior(new_behavior_cls)
 
     @property
     def quack_behavior(self):
@@ -112,7 +287,7 @@ class Duck(object):
 
     @quack_behavior.setter
     def quack_behavior(self, new_behavior_cls):
-        self._quack_behavior = new_behavior_cls()
+        self._quack_behavior = get_behavior(new_behavior_cls)
 
     def perform_fly(self):
         self.fly_behavior.fly()
@@ -121,7 +296,7 @@ class Duck(object):
         self.quack_behavior.quack()
 
     def swim(self):
-        print("All ducks can swim!")
+        _sink.write("All ducks can swim!")
 
 
 # if I only have a couple of ducks, just make them
@@ -134,12 +309,395 @@ class DuckFactory(object):
     """
     Factory to make ducks!
     """
+    # (quack behavior, fly behavior) for each kind of duck we know about
+    specs = {
+        'mallard': (QuackMixin, FlyWithWingsMixin),
+        'model_duck': (QuackMixin, FlyNoWayMixin),
+    }
+
     def create_mallard(self):
         return Duck(QuackMixin, FlyWithWingsMixin)
 
     def create_model_duck(self):
         return Duck(QuackMixin, FlyNoWayMixin)
 
+    def create_many(self, spec, n):
+        """
+        Create n ducks. spec is either a name from specs or a
+        (quack behavior, fly behavior) pair
+        """
+        if isinstance(spec, str):
+            if spec not in self.specs:
+                raise ValueError('unknown duck spec {!r}'.format(spec))
+            spec = self.specs[spec]
+        quack_behavior_cls, fly_behavior_cls = spec
+        return [Duck(quack_behavior_cls, fly_behavior_cls) for _ in range(n)]
+
+    def create_mallards(self, n):
+        return self.create_many('mallard', n)
+
+    def create_model_ducks(self, n):
+        return self.create_many('model_duck', n)
+
+
+class DuckPool(object):
+    """
+    Pool of ducks to reuse instead of creating new ones every time
+    """
+    def __init__(self, quack_behavior_cls, fly_behavior_cls, size=0):
+        self.quack_behavior_cls = quack_behavior_cls
+        self.fly_behavior_cls = fly_behavior_cls
+        self.free_ducks = DuckFactory().create_many(
+            (quack_behavior_cls, fly_behavior_cls), size)
+        # the same ducks as free_ducks, for a quick membership check
+        self._free = set(self.free_ducks)
+
+    def __len__(self):
+        return len(self.free_ducks)
+
+    def reset(self, duck):
+        """
+        Put the duck back to the pool's behaviors
+        """
+        duck.quack_behavior = self.quack_behavior_cls
+        duck.fly_behavior = self.fly_behavior_cls
+
+    def acquire(self):
+        if self.free_ducks:
+            duck = self.free_ducks.pop()
+            self._free.discard(duck)
+            return duck
+        return Duck(self.quack_behavior_cls, self.fly_behavior_cls)
+
+    def release(self, duck):
+        if duck in self._free:
+            raise ValueError('duck is already in the pool')
+        self.reset(duck)
+        self.free_ducks.append(duck)
+        self._free.add(duck)
+
+
+class FixedBehaviorDuck(object):
+    """
+    Base class for the duck classes made by DuckClassFactory.
+    The behaviors live on the class, so instances carry nothing.
+    """
+    __slots__ = ()
+
+    fly_behavior = None
+    quack_behavior = None
+
+    def swim(self):
+        _sink.write("All ducks can swim!")
+
+
+class DuckClassFactory(object):
+    """
+    Factory to make one duck class per (quack behavior, fly behavior) pair,
+    with perform_fly and perform_quack bound at class level
+    """
+    duck_classes = {}
+
+    def get_duck_class(self, quack_behavior_cls, fly_behavior_cls):
+        key = (quack_behavior_cls, fly_behavior_cls)
+        try:
+            return self.duck_classes[key]
+        except KeyError:
+            pass
+
+        fly_behavior = get_behavior(fly_behavior_cls)
+        quack_behavior = get_behavior(quack_behavior_cls)
+        name = '{}{}Duck'.format(quack_behavior_cls.__name__.replace('Mixin', ''),
+                                 fly_behavior_cls.__name__.replace('Mixin', ''))
+        duck_class = type(name, (FixedBehaviorDuck,), {
+            '__slots__': (),
+            'fly_behavior': fly_behavior,
+            'quack_behavior': quack_behavior,
+            'perform_fly': staticmethod(fly_behavior.fly),
+            'perform_quack': staticmethod(quack_behavior.quack),
+        })
+        self.duck_classes[key] = duck_class
+        return duck_class
+
+    def create_duck(self, quack_behavior_cls, fly_behavior_cls):
+        return self.get_duck_class(quack_behavior_cls, fly_behavior_cls)()
+
+
+# or, suppose we have a whole lot of ducks
+class DuckFlock(object):
+    """
+    Columnar container of ducks. Each duck is stored as a small integer
+    code per behavior, indexing into a table of behavior classes.
+    """
+    def __init__(self):
+        self.fly_behaviors = []
+        self.quack_behaviors = []
+        self._fly_codes = array('B')
+        self._quack_codes = array('B')
+
+    @staticmethod
+    def _code_for(behaviors, behavior_cls):
+        """
+        Return the code of behavior_cls, adding it to the table if needed
+        """
+        try:
+            return behaviors.index(behavior_cls)
+        except ValueError:
+            pass
+        # codes are stored in one byte
+        if len(behaviors) >= 256:
+            raise ValueError('a DuckFlock holds at most 256 behavior classes of each kind')
+        behaviors.append(behavior_cls)
+        return len(behaviors) - 1
+
+    def __len__(self):
+        return len(self._fly_codes)
+
+    def __getitem__(self, index):
+        return Duck(self.quack_behaviors[self._quack_codes[index]],
+                    self.fly_behaviors[self._fly_codes[index]])
+
+    def add_duck(self, quack_behavior_cls, fly_behavior_cls):
+        quack_code = self._code_for(self.quack_behaviors, quack_behavior_cls)
+        fly_code = self._code_for(self.fly_behaviors, fly_behavior_cls)
+        self._quack_codes.append(quack_code)
+        self._fly_codes.append(fly_code)
+
+    def set_fly_behavior(self, index, fly_behavior_cls):
+        self._fly_codes[index] = self._code_for(self.fly_behaviors, fly_behavior_cls)
+
+    def set_quack_behavior(self, index, quack_behavior_cls):
+        self._quack_codes[index] = self._code_for(self.quack_behaviors, quack_behavior_cls)
+
+    def set_fly_behavior_where(self, mask, fly_behavior_cls):
+        """
+        Swap the fly behavior of every duck whose entry in mask is true
+        """
+        code = self._code_for(self.fly_behaviors, fly_behavior_cls)
+        for index, selected in enumerate(mask):
+            if selected:
+                self._fly_codes[index] = code
+
+    def set_quack_behavior_where(self, mask, quack_behavior_cls):
+        """
+        Swap the quack behavior of every duck whose entry in mask is true
+        """
+        code = self._code_for(self.quack_behaviors, quack_behavior_cls)
+        for index, selected in enumerate(mask):
+            if selected:
+                self._quack_codes[index] = code
+
+    @staticmethod
+    def _perform(behaviors, codes, method_name):
+        """
+        Group the ducks by behavior and make one call per group
+        :return: dict of behavior class -> number of ducks
+        """
+        counts = Counter(codes)
+        for code, count in counts.items():
+            getattr(get_behavior(behaviors[code]), method_name + '_many')(count)
+        return dict((behaviors[code], count) for code, count in counts.items())
+
+    def perform_fly(self):
+        return self._perform(self.fly_behaviors, self._fly_codes, 'fly')
+
+    def perform_quack(self):
+        return self._perform(self.quack_behaviors, self._quack_codes, 'quack')
+
+
+# -----------------
+# Snapshots
+# -----------------
+# File layout: header, JSON table of behavior classes,
+# one byte per duck of quack codes, then one byte per duck of fly codes.
+SNAPSHOT_MAGIC = b'DUCK'
+SNAPSHOT_VERSION = 1
+_snapshot_header = struct.Struct('<4sBII')  # magic, version, ducks, table size
+
+
+def _behavior_name(behavior_cls, base_cls):
+    """
+    Return the name a snapshot stores for behavior_cls, making sure
+    load_snapshot will be able to import the same class back
+    """
+    if not (isinstance(behavior_cls, type) and issubclass(behavior_cls, base_cls)):
+        raise ValueError('cannot snapshot {!r}: not a {}'.format(behavior_cls, base_cls.__name__))
+    name = '{}:{}'.format(behavior_cls.__module__, behavior_cls.__name__)
+    if behavior_cls.__module__ == '__main__':
+        raise ValueError('cannot snapshot {}: it is defined in a script, '
+                         'so it could not be imported when loading'.format(name))
+    try:
+        importable = _behavior_from_name(name, base_cls) is behavior_cls
+    except (ImportError, AttributeError, ValueError):
+        importable = False
+    if not importable:
+        raise ValueError('cannot snapshot {}: it can not be imported by that name'.format(name))
+    return name
+
+
+def _behavior_from_name(name, base_cls):
+    """
+    Import the behavior class a snapshot names, making sure it is a base_cls
+    """
+    module_name, cls_name = name.split(':')
+    behavior_cls = getattr(importlib.import_module(module_name), cls_name)
+    if not (isinstance(behavior_cls, type) and issubclass(behavior_cls, base_cls)):
+        raise ValueError('{} is not a {}'.format(name, base_cls.__name__))
+    return behavior_cls
+
+
+def save_snapshot(path, ducks):
+    """
+    Write ducks (a DuckFlock or any iterable of ducks) to path.
+    Raises ValueError, before writing anything, if a behavior class
+    could not be imported back by load_snapshot.
+    """
+    if not isinstance(ducks, DuckFlock):
+        flock = DuckFlock()
+        for duck in ducks:
+            flock.add_duck(type(duck.quack_behavior), type(duck.fly_behavior))
+        ducks = flock
+
+    table = json.dumps({
+        'quack': [_behavior_name(cls, QuackBehaviorMixinBase) for cls in ducks.quack_behaviors],
+        'fly': [_behavior_name(cls, FlyBehaviorMixinBase) for cls in ducks.fly_behaviors],
+    }).encode('utf-8')
+    with open(path, 'wb') as snapshot_file:
+        snapshot_file.write(_snapshot_header.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(ducks), len(table)))
+        snapshot_file.write(table)
+        snapshot_file.write(ducks._quack_codes.tobytes())
+        snapshot_file.write(ducks._fly_codes.tobytes())
+
+
+class DuckSnapshot(object):
+    """
+    Read-only view of a snapshot file. Ducks are only
+    made when they are accessed.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot_file:
+            if not os.fstat(snapshot_file.fileno()).st_size:
+                raise ValueError('{} is empty, not a duck snapshot'.format(path))
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._load_table(path)
+        except Exception:
+            self.close()
+            raise
+
+    def _load_table(self, path):
+        if len(self._map) < _snapshot_header.size:
+            raise ValueError('{} is truncated'.format(path))
+        magic, version, self._size, table_size = _snapshot_header.unpack_from(self._map)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError('{} is not a version {} duck snapshot'
+                             .format(path, SNAPSHOT_VERSION))
+
+        table_start = _snapshot_header.size
+        self._quack_start = table_start + table_size
+        self._fly_start = self._quack_start + self._size
+        if len(self._map) < self._fly_start + self._size:
+            raise ValueError('{} is truncated'.format(path))
+
+        table = json.loads(self._map[table_start:self._quack_start].decode('utf-8'))
+        self.quack_behaviors = [_behavior_from_name(name, QuackBehaviorMixinBase)
+                                for name in table['quack']]
+        self.fly_behaviors = [_behavior_from_name(name, FlyBehaviorMixinBase)
+                              for name in table['fly']]
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('duck index out of range')
+        return Duck(self.quack_behaviors[self._map[self._quack_start + index]],
+                    self.fly_behaviors[self._map[self._fly_start + index]])
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield self[index]
+
+    def to_flock(self):
+        """
+        Copy the whole snapshot into a DuckFlock
+        """
+        flock = DuckFlock()
+        flock.quack_behaviors = list(self.quack_behaviors)
+        flock.fly_behaviors = list(self.fly_behaviors)
+        flock._quack_codes = array('B', self._map[self._quack_start:self._fly_start])
+        flock._fly_codes = array('B', self._map[self._fly_start:self._fly_start + self._size])
+        return flock
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_snapshot(path):
+    return DuckSnapshot(path)
+
+
+def benchmark_memory(n=1000000):
+    """
+    Compare the memory used by n slotted ducks sharing their behaviors
+    against n ducks in the old layout (a __dict__ per duck and fresh
+    behavior objects per duck, like MallardDuck)
+    :return: dict of layout name -> bytes allocated
+    """
+    import tracemalloc
+
+    results = {}
+    for name, make_duck in (('Duck', lambda: Duck(QuackMixin, FlyWithWingsMixin)),
+                            ('MallardDuck', MallardDuck)):
+        tracemalloc.start()
+        ducks = [make_duck() for _ in range(n)]
+        results[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del ducks
+    return results
+
+
+def benchmark_dispatch(n=1000000):
+    """
+    Time n perform_fly() calls and measure n instances for Duck, DuckABC
+    and a DuckClassFactory class, with output going to a NullSink
+    :return: dict of layout name -> (seconds, bytes allocated)
+    """
+    import timeit
+    import tracemalloc
+
+    layouts = (
+        ('Duck', lambda: Duck(QuackMixin, FlyWithWingsMixin)),
+        ('DuckABC', MallardDuck),
+        ('DuckClassFactory', DuckClassFactory().get_duck_class(QuackMixin, FlyWithWingsMixin)),
+    )
+    previous = set_sink(NullSink())
+    results = {}
+    try:
+        for name, make_duck in layouts:
+            duck = make_duck()
+            seconds = timeit.timeit(duck.perform_fly, number=n)
+
+            tracemalloc.start()
+            ducks = [make_duck() for _ in range(n)]
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del ducks
+
+            results[name] = (seconds, size)
+    finally:
+        set_sink(previous)
+    return results
+
 
 if __name__ == '__main__':
     print("Let's make a mallard duck!")
@@ -163,3 +721,26 @@ if __name__ == '__main__':
     factory_model_duck.perform_fly()
     factory_model_duck.fly_behavior = FlyRocketPoweredMixin
     factory_model_duck.perform_fly()
+
+    print("Let's borrow a duck from the pool")
+    duck_pool = DuckPool(QuackMixin, FlyNoWayMixin, size=2)
+    pool_duck = duck_pool.acquire()
+    pool_duck.fly_behavior = FlyRocketPoweredMixin
+    pool_duck.perform_fly()
+    duck_pool.release(pool_duck)
+    duck_pool.acquire().perform_fly()
+
+    print("Let's make ducks from a duck class factory")
+    duck_class_factory = DuckClassFactory()
+    rocket_duck = duck_class_factory.create_duck(SqueakMixin, FlyRocketPoweredMixin)
+    rocket_duck.perform_quack()
+    rocket_duck.perform_fly()
+
+    print("Let's make a flock of ducks")
+    flock = DuckFlock()
+    for _ in range(3):
+        flock.add_duck(QuackMixin, FlyWithWingsMixin)
+    flock.add_duck(SqueakMixin, FlyNoWayMixin)
+    flock.set_fly_behavior(0, FlyRocketPoweredMixin)
+    flock.perform_fly()
+    flock.perform_quack()
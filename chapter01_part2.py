@@ -0,0 +1,144 @@
+"""
+Chapter One -- Intro to Design Patterns
+
+A duck pond simulation.
+Lots of ducks flying, quacking and swimming on an asyncio event loop,
+with their behaviors swapped at runtime (that's the Strategy pattern
+paying off).
+"""
+import asyncio
+import math
+import time
+
+from chapter01 import (
+    DuckFactory, FlyRocketPoweredMixin, FlyWithWingsMixin, ModelDuck,
+    NullSink, PrintSink, QuackMixin, get_behavior, set_sink
+)
+
+
+class DuckPond(object):
+    """
+    Runs the ducks tick by tick. Each tick, every duck does one event
+    (fly, quack or swim, in turn). Ducks are handled in batches and the
+    pond yields to the event loop between batches.
+
+    The ducks write to the chapter01 sink. The pond leaves it alone, so
+    set it once before running (a NullSink to measure the ducks alone).
+    """
+    events = ('perform_fly', 'perform_quack', 'swim')
+
+    def __init__(self, ducks, batch_size=10000):
+        self.ducks = list(ducks)
+        self.batch_size = batch_size
+        self.swaps = {}
+        self.event_count = 0
+        self.tick_latencies = []
+        self.elapsed = 0.0
+
+    def schedule_swap(self, tick, index, fly_behavior_cls=None, quack_behavior_cls=None):
+        """
+        Change the behaviors of duck number index at the start of tick
+        """
+        self.swaps.setdefault(tick, []).append((index, fly_behavior_cls, quack_behavior_cls))
+
+    def _swap(self, index, fly_behavior_cls, quack_behavior_cls):
+        duck = self.ducks[index]
+        # DuckABC ducks take behavior objects, Duck ducks take classes
+        if hasattr(duck, 'set_fly_behavior'):
+            if fly_behavior_cls:
+                duck.set_fly_behavior(get_behavior(fly_behavior_cls))
+            if quack_behavior_cls:
+                duck.set_quack_behavior(get_behavior(quack_behavior_cls))
+        else:
+            if fly_behavior_cls:
+                duck.fly_behavior = fly_behavior_cls
+            if quack_behavior_cls:
+                duck.quack_behavior = quack_behavior_cls
+
+    async def tick(self, tick_number):
+        for swap in self.swaps.pop(tick_number, ()):
+            self._swap(*swap)
+
+        event = self.events[tick_number % len(self.events)]
+        for start in range(0, len(self.ducks), self.batch_size):
+            for duck in self.ducks[start:start + self.batch_size]:
+                getattr(duck, event)()
+            self.event_count += min(self.batch_size, len(self.ducks) - start)
+            await asyncio.sleep(0)
+
+    async def run(self, ticks, tick_interval=0.0):
+        """
+        Run the pond for a number of ticks, starting a tick
+        at most every tick_interval seconds
+        """
+        started = time.perf_counter()
+        try:
+            for tick_number in range(ticks):
+                tick_started = time.perf_counter()
+                await self.tick(tick_number)
+                latency = time.perf_counter() - tick_started
+                self.tick_latencies.append(latency)
+                if tick_interval > latency:
+                    await asyncio.sleep(tick_interval - latency)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    @property
+    def busy(self):
+        """
+        Seconds spent in ticks, leaving out the sleeps between them
+        """
+        return sum(self.tick_latencies)
+
+    def events_per_second(self):
+        """
+        Events per second of tick time
+        """
+        busy = self.busy
+        return self.event_count / busy if busy else 0.0
+
+    def wall_events_per_second(self):
+        """
+        Events per second of wall time, sleeps between ticks included
+        """
+        return self.event_count / self.elapsed if self.elapsed else 0.0
+
+    def latency_percentile(self, percent):
+        """
+        Return the tick latency, in seconds, that percent of the ticks are at or below
+        """
+        if not self.tick_latencies:
+            return 0.0
+        latencies = sorted(self.tick_latencies)
+        # nearest rank
+        index = max(0, int(math.ceil(len(latencies) * percent / 100.0)) - 1)
+        return latencies[index]
+
+    def report(self):
+        return {
+            'events': self.event_count,
+            'events_per_second': self.events_per_second(),
+            'wall_events_per_second': self.wall_events_per_second(),
+            'p50': self.latency_percentile(50),
+            'p90': self.latency_percentile(90),
+            'p99': self.latency_percentile(99),
+        }
+
+
+if __name__ == '__main__':
+    # let's fill a pond with ducks
+    ducks = DuckFactory().create_many((QuackMixin, FlyWithWingsMixin), 100000)
+    ducks.append(ModelDuck())
+    pond = DuckPond(ducks)
+    set_sink(NullSink())
+
+    # half way through, the model duck gets a rocket
+    pond.schedule_swap(5, len(ducks) - 1, fly_behavior_cls=FlyRocketPoweredMixin)
+    asyncio.run(pond.run(10))
+    set_sink(PrintSink())
+
+    report = pond.report()
+    print("{} events at {:.0f} events/s".format(report['events'], report['events_per_second']))
+    print("tick latency p50 {:.4f}s, p90 {:.4f}s, p99 {:.4f}s"
+          .format(report['p50'], report['p90'], report['p99']))
+    ducks[-1].perform_fly()
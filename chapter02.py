@@ -1,6 +1,11 @@
 """
 Chapter Two -- Observer Pattern
 """
+from array import array
+import threading
+import time
+import weakref
+
 
 # ------------------------
 # interfaces
@@ -21,6 +26,31 @@ class ObserverInterface(object):
         raise NotImplementedError
 
 
+class BatchObserverInterface(ObserverInterface):
+    """
+    Observer that can take a whole batch of readings in one call.
+    The arguments are equal-length sequences (e.g. NumPy arrays).
+    """
+    def update_batch(self, temps, humidities, pressures):
+        raise NotImplementedError
+
+
+class ProcessObserverInterface(ObserverInterface):
+    """
+    Observer whose work can run in another process.
+    worker_function is a module-level function (so it can be pickled),
+    set with staticmethod(), that takes (temp, humidity, pressure);
+    its result is passed to update_result() in the observer's process.
+    """
+    worker_function = None
+
+    def update_result(self, result):
+        raise NotImplementedError
+
+    def update(self, temp, humidity, pressure):
+        self.update_result(self.worker_function(temp, humidity, pressure))
+
+
 class DisplayElementInterface(object):
     def display(self):
         raise NotImplementedError
@@ -30,12 +60,50 @@ class DisplayElementInterface(object):
 # concrete implementations
 # ------------------------
 class WeatherData(SubjectInterface):
-    def __init__(self):
-        self.observers = set()
+    """
+    Weather station subject.
+
+    suppress_unchanged: don't notify when a reading is the same as the last one.
+    coalesce_window: notify at most once per this many seconds; readings
+        that come in during the window are held and only the latest one is
+        sent when the window closes or on flush(). When the window closes
+        by itself, the observers are called from a timer thread, so they
+        must be safe to call from another thread.
+    weak_observers: only hold weak references to the observers, so
+        observers that are gone drop out without being removed.
+    instrument: time every call to an observer (update(), update_batch(),
+        subscriber updates) and keep the results in self.stats (an
+        ObserverStats, see chapter02_part9).
+    """
+    fields = ('temperature', 'humidity', 'pressure')
+
+    def __init__(self, suppress_unchanged=False, coalesce_window=0.0, weak_observers=False,
+                 instrument=False):
+        self.observers = weakref.WeakSet() if weak_observers else set()
+        self.stats = None
+        if instrument:
+            from chapter02_part9 import ObserverStats
+            self.stats = ObserverStats()
         self.temperature = 0.0
         self.humidity = 0.0
         self.pressure = 0.0
 
+        self.suppress_unchanged = suppress_unchanged
+        self.coalesce_window = coalesce_window
+        self.suppressed_count = 0
+        self.coalesced_count = 0
+        self._has_reading = False
+        self._last_notified = None
+        self._pending_timer = None
+        self._pending_reading = None
+        self._lock = threading.Lock()
+
+        # field name -> {observer: condition}, for observers that only
+        # want to hear about some of the measurements
+        subscriber_map = weakref.WeakKeyDictionary if weak_observers else dict
+        self.field_subscribers = dict((field, subscriber_map()) for field in self.fields)
+        self._notified_values = {}
+
     def register_observer(self, observer):
         self.observers.add(observer)
 
@@ -45,41 +113,457 @@ class WeatherData(SubjectInterface):
         except KeyError:
             pass
 
-    def notify_observers(self):
-        for observer in self.observers:
-            observer.update(self.temperature, self.humidity, self.pressure)
+    def current_reading(self):
+        return (self.temperature, self.humidity, self.pressure)
+
+    def notify_observers(self, reading=None):
+        """
+        Update every observer with reading, or the current measurements
+        """
+        if reading is None:
+            reading = self.current_reading()
+        if self.stats is not None:
+            self._notify_observers_timed(reading)
+            return
+        # loop over a copy, observers may be added or removed meanwhile
+        for observer in tuple(self.observers):
+            observer.update(*reading)
+
+    def _notify_observers_timed(self, reading):
+        for observer in tuple(self.observers):
+            self._call_timed(observer, observer.update, *reading)
+
+    def _deliver(self, observer, method, *args):
+        if self.stats is not None:
+            self._call_timed(observer, method, *args)
+        else:
+            method(*args)
+
+    def _call_timed(self, observer, method, *args):
+        started = time.perf_counter()
+        try:
+            method(*args)
+        except Exception:
+            self.stats.record(observer, time.perf_counter() - started, failed=True)
+            raise
+        self.stats.record(observer, time.perf_counter() - started)
+
+    def subscribe(self, observer, fields, condition=None):
+        """
+        Only update observer when one of fields changes and,
+        if given, condition(new value of that field) is true
+        """
+        for field in fields:
+            if field not in self.field_subscribers:
+                raise ValueError('unknown field {!r}'.format(field))
+            self.field_subscribers[field][observer] = condition
+
+    def unsubscribe(self, observer):
+        for subscribers in self.field_subscribers.values():
+            subscribers.pop(observer, None)
+
+    def notify_subscribers(self, reading=None):
+        """
+        Update the subscribers of the fields that changed since the last time
+        """
+        if reading is None:
+            reading = self.current_reading()
+        for observer in self._changed_subscribers(reading):
+            self._update_subscriber(observer, reading)
+
+    def _changed_subscribers(self, reading):
+        """
+        :return: list of the subscribers reading should go to, each once
+        """
+        notified = []
+        seen = set()
+        for field, value in zip(self.fields, reading):
+            subscribers = self.field_subscribers[field]
+            if field in self._notified_values and self._notified_values[field] == value:
+                continue
+            self._notified_values[field] = value
+            for observer, condition in list(subscribers.items()):
+                if observer in seen or (condition is not None and not condition(value)):
+                    continue
+                seen.add(observer)
+                notified.append(observer)
+        return notified
 
-    def measurements_changed(self):
-        self.notify_observers()
+    def _update_subscriber(self, observer, reading):
+        self._deliver(observer, observer.update, *reading)
+
+    def measurements_changed(self, reading=None):
+        self.notify_observers(reading)
+        self.notify_subscribers(reading)
 
     def set_measurements(self, temperature, humidity, pressure):
+        if self.coalesce_window:
+            self._coalesce((temperature, humidity, pressure))
+            return
+
+        if (self.suppress_unchanged and self._has_reading and
+                (temperature, humidity, pressure) == (self.temperature, self.humidity, self.pressure)):
+            self.suppressed_count += 1
+            return
+
         self.temperature = temperature
         self.pressure = pressure
         self.humidity = humidity
+        self._has_reading = True
         self.measurements_changed()
 
+    def set_measurements_batch(self, temps, humidities, pressures):
+        """
+        Take many readings at once (equal-length sequences or NumPy arrays,
+        oldest first). Batch observers get the whole vectors in one call,
+        the others get one update() per reading.
+        Suppression and coalescing don't apply to batches.
+        """
+        if not self._take_batch(temps, humidities, pressures):
+            return
 
-class CurrentConditionsDisplay(ObserverInterface, DisplayElementInterface):
-    def __init__(self, weather_data):
+        for observer in tuple(self.observers):
+            if isinstance(observer, BatchObserverInterface):
+                self._deliver(observer, observer.update_batch, temps, humidities, pressures)
+            else:
+                for reading in zip(temps, humidities, pressures):
+                    self._deliver(observer, observer.update, *reading)
+        self.notify_subscribers()
+
+    def _take_batch(self, temps, humidities, pressures):
+        """
+        Check the batch and make its latest reading the current measurements
+        :return: False if the batch is empty
+        """
+        size = len(temps)
+        if len(humidities) != size or len(pressures) != size:
+            raise ValueError('temps, humidities and pressures must be the same length')
+        if not size:
+            return False
+
+        self.temperature = temps[-1]
+        self.humidity = humidities[-1]
+        self.pressure = pressures[-1]
+        self._has_reading = True
+        return True
+
+    def _coalesce(self, reading):
+        """
+        set_measurements with a coalescing window. The measurements and
+        the pending reading only change under the lock, so a notification
+        never mixes fields from two readings.
+        """
+        with self._lock:
+            if self.suppress_unchanged and self._has_reading and reading == self.current_reading():
+                self.suppressed_count += 1
+                return
+            self.temperature, self.humidity, self.pressure = reading
+            self._has_reading = True
+
+            if self._pending_timer is not None:
+                # the pending reading is replaced by this one
+                self._pending_reading = reading
+                self.coalesced_count += 1
+                return
+
+            now = time.monotonic()
+            if self._last_notified is not None and now - self._last_notified < self.coalesce_window:
+                self._pending_reading = reading
+                self._pending_timer = threading.Timer(
+                    self._last_notified + self.coalesce_window - now, self.flush)
+                self._pending_timer.daemon = True
+                self._pending_timer.start()
+                return
+            self._last_notified = now
+        self.measurements_changed(reading)
+
+    def flush(self):
+        """
+        Send the reading held back by the coalescing window, if any
+        """
+        with self._lock:
+            if self._pending_timer is None:
+                return
+            self._pending_timer.cancel()
+            self._pending_timer = None
+            reading, self._pending_reading = self._pending_reading, None
+            self._last_notified = time.monotonic()
+        self.measurements_changed(reading)
+
+    @property
+    def saved_notifications(self):
+        return self.suppressed_count + self.coalesced_count
+
+
+def threshold(above=None, below=None):
+    """
+    Make a subscription condition that is true when the value
+    is above and/or below the given limits
+    """
+    def condition(value):
+        return ((above is None or value > above) and
+                (below is None or value < below))
+    return condition
+
+
+class CurrentConditionsDisplay(BatchObserverInterface, DisplayElementInterface):
+    """
+    Shows the current temperature and humidity.
+
+    With max_refresh_rate set, update() only stores the reading and marks
+    the display dirty; it is drawn at most max_refresh_rate times a second,
+    by update() itself, by render(), or only by a timer while one is
+    running (see start_timer()). Without a running timer, a reading that
+    arrives too soon is drawn by one trailing render from a timer thread
+    when the refresh interval is up, so the last reading of a burst
+    always shows.
+    """
+    def __init__(self, weather_data, max_refresh_rate=None):
+        if max_refresh_rate is not None and not max_refresh_rate > 0:
+            raise ValueError('max_refresh_rate must be greater than 0')
         self.temperature = 0.0
         self.humidity = 0.0
+        self.max_refresh_rate = max_refresh_rate
+        self.dirty = False
+        self._last_render = None
+        self._timer_stop = None
+        self._trailing_render = None
+        self._render_lock = threading.Lock()
         self.weather_data = weather_data
         self.weather_data.register_observer(self)
 
     def update(self, temperature, humidity, pressure):
         self.temperature = temperature
         self.humidity = humidity
+        self._changed()
+
+    def update_batch(self, temps, humidities, pressures):
+        # only the latest reading is current, so display once
+        self.temperature = temps[-1]
+        self.humidity = humidities[-1]
+        self._changed()
+
+    def _changed(self):
+        if self.max_refresh_rate is None:
+            self.display()
+            return
+        self.dirty = True
+        if self._timer_stop is not None:
+            return
+        interval = 1.0 / self.max_refresh_rate
+        wait = 0.0
+        if self._last_render is not None:
+            wait = self._last_render + interval - time.monotonic()
+        if wait <= 0:
+            self.render()
+        elif self._trailing_render is None:
+            self._trailing_render = threading.Timer(wait, self._render_trailing)
+            self._trailing_render.daemon = True
+            self._trailing_render.start()
+
+    def _render_trailing(self):
+        self._trailing_render = None
+        self.render()
+
+    def render(self):
+        """
+        Display the latest reading if it hasn't been displayed yet
+        """
+        with self._render_lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            self._last_render = time.monotonic()
         self.display()
 
+    def start_timer(self):
+        """
+        Render from a background thread every 1 / max_refresh_rate seconds
+        """
+        if self.max_refresh_rate is None:
+            raise ValueError('start_timer needs a max_refresh_rate')
+        if self._timer_stop is not None:
+            return
+        self._timer_stop = threading.Event()
+        interval = 1.0 / self.max_refresh_rate
+
+        def run(stop):
+            while not stop.wait(interval):
+                self.render()
+        threading.Thread(target=run, args=(self._timer_stop,), daemon=True).start()
+
+    def stop_timer(self):
+        if self._timer_stop is not None:
+            self._timer_stop.set()
+            self._timer_stop = None
+        self.render()
+
     def display(self):
         print("Current conditions: {} F degrees, {} % humidity"
               .format(self.temperature, self.humidity))
 
 
+class MeasurementHistory(BatchObserverInterface):
+    """
+    Keeps the last `capacity` readings in fixed-size typed arrays,
+    overwriting the oldest ones, so memory stays flat
+    """
+    def __init__(self, weather_data, capacity=1024):
+        self.capacity = capacity
+        self.temperatures = array('d', [0.0]) * capacity
+        self.humidities = array('d', [0.0]) * capacity
+        self.pressures = array('d', [0.0]) * capacity
+        self.next_index = 0
+        self.count = 0
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    def __len__(self):
+        return self.count
+
+    def update(self, temperature, humidity, pressure):
+        index = self.next_index
+        self.temperatures[index] = temperature
+        self.humidities[index] = humidity
+        self.pressures[index] = pressure
+        self.next_index = (index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def update_batch(self, temps, humidities, pressures):
+        for reading in zip(temps, humidities, pressures):
+            self.update(*reading)
+
+    def readings(self):
+        """
+        Return the stored (temperature, humidity, pressure) readings, oldest first
+        """
+        start = (self.next_index - self.count) % self.capacity
+        indexes = [(start + offset) % self.capacity for offset in range(self.count)]
+        return [(self.temperatures[i], self.humidities[i], self.pressures[i]) for i in indexes]
+
+
+class StatisticsDisplay(ObserverInterface, DisplayElementInterface):
+    """
+    Running temperature statistics. Each update is O(1):
+    the mean and variance are kept with Welford's method.
+    """
+    def __init__(self, weather_data):
+        self.count = 0
+        self.mean = 0.0
+        self._sum_squares = 0.0
+        self.min_temperature = None
+        self.max_temperature = None
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    @property
+    def variance(self):
+        return self._sum_squares / self.count if self.count else 0.0
+
+    def update(self, temperature, humidity, pressure):
+        self.count += 1
+        delta = temperature - self.mean
+        self.mean += delta / self.count
+        self._sum_squares += delta * (temperature - self.mean)
+        if self.min_temperature is None or temperature < self.min_temperature:
+            self.min_temperature = temperature
+        if self.max_temperature is None or temperature > self.max_temperature:
+            self.max_temperature = temperature
+        self.display()
+
+    def display(self):
+        print("Avg/Max/Min temperature = {:.1f}/{}/{} (variance {:.1f})"
+              .format(self.mean, self.max_temperature, self.min_temperature, self.variance))
+
+
+class ForecastDisplay(ObserverInterface, DisplayElementInterface):
+    """
+    Guesses the weather from the pressure trend
+    """
+    def __init__(self, weather_data):
+        self.current_pressure = 29.92
+        self.last_pressure = None
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    def update(self, temperature, humidity, pressure):
+        self.last_pressure = self.current_pressure
+        self.current_pressure = pressure
+        self.display()
+
+    def display(self):
+        if self.current_pressure > self.last_pressure:
+            print("Forecast: Improving weather on the way!")
+        elif self.current_pressure == self.last_pressure:
+            print("Forecast: More of the same")
+        else:
+            print("Forecast: Watch out for cooler, rainy weather")
+
+
+def heat_index_worker(temperature, humidity, pressure):
+    return HeatIndexDisplay.compute_heat_index(temperature, humidity)
+
+
+class HeatIndexDisplay(ProcessObserverInterface, DisplayElementInterface):
+    """
+    Shows how hot it feels. The heat index can be worked out
+    in another process (see chapter02_part7.ParallelWeatherData).
+    """
+    worker_function = staticmethod(heat_index_worker)
+
+    def __init__(self, weather_data):
+        self.heat_index = 0.0
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    @staticmethod
+    def compute_heat_index(t, rh):
+        return ((16.923 + (0.185212 * t) + (5.37941 * rh) - (0.100254 * t * rh) +
+                 (0.00941695 * (t * t)) + (0.00728898 * (rh * rh)) +
+                 (0.000345372 * (t * t * rh)) - (0.000814971 * (t * rh * rh)) +
+                 (0.0000102102 * (t * t * rh * rh)) - (0.000038646 * (t * t * t)) +
+                 (0.0000291583 * (rh * rh * rh)) + (0.00000142721 * (t * t * t * rh)) +
+                 (0.000000197219 * (t * rh * rh * rh)) - (0.0000000218429 * (t * t * t * rh * rh)) +
+                 (0.000000000843296 * (t * t * rh * rh * rh))) -
+                (0.0000000000481975 * (t * t * t * rh * rh * rh)))
+
+    def update_result(self, heat_index):
+        self.heat_index = heat_index
+        self.display()
+
+    def display(self):
+        print("Heat index is {:.5f}".format(self.heat_index))
+
+
+def benchmark_display_leak(n=10000, weak_observers=True):
+    """
+    Create and drop n displays on one WeatherData
+    :return: (observers still registered, bytes still allocated)
+    """
+    import gc
+    import tracemalloc
+
+    weather_data = WeatherData(weak_observers=weak_observers)
+    tracemalloc.start()
+    for _ in range(n):
+        CurrentConditionsDisplay(weather_data)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(weather_data.observers), size
+
+
 if __name__ == "__main__":
     weather_data = WeatherData()
     current_display = CurrentConditionsDisplay(weather_data)
+    statistics_display = StatisticsDisplay(weather_data)
+    forecast_display = ForecastDisplay(weather_data)
+    heat_index_display = HeatIndexDisplay(weather_data)
+    history = MeasurementHistory(weather_data, capacity=4)
 
     weather_data.set_measurements(80, 65, 30.4)
     weather_data.set_measurements(82, 70, 29.2)
     weather_data.set_measurements(78, 90, 29.2)
+
+    # backfill a batch of readings in one call
+    weather_data.set_measurements_batch([70, 72, 75], [50, 55, 60], [30.1, 30.0, 29.9])
@@ -0,0 +1,119 @@
+"""
+Chapter Two -- Observer Pattern
+
+Changing the observers while notifying them.
+The copy-on-write subject swaps in a new immutable set of observers on
+every change, so notifications loop over the current set without a lock
+and without copying it.
+"""
+import threading
+import time
+
+from chapter02 import ObserverInterface, WeatherData
+
+
+class CopyOnWriteWeatherData(WeatherData):
+    """
+    WeatherData whose observers are an immutable frozenset. Registering
+    or removing an observer builds a new set under a lock and swaps it in,
+    so notify_observers can loop over its snapshot without locking while
+    other threads change the observers.
+    """
+    def __init__(self, **kwargs):
+        if kwargs.get('weak_observers'):
+            raise ValueError('CopyOnWriteWeatherData does not support weak_observers')
+        super(CopyOnWriteWeatherData, self).__init__(**kwargs)
+        self.observers = frozenset()
+        self._observers_lock = threading.Lock()
+
+    def register_observer(self, observer):
+        with self._observers_lock:
+            self.observers = self.observers | {observer}
+
+    def remove_observer(self, observer):
+        with self._observers_lock:
+            self.observers = self.observers - {observer}
+
+    def notify_observers(self, reading=None):
+        if reading is None:
+            reading = self.current_reading()
+        # the set is never changed in place, so loop over it without copying
+        observers = self.observers
+        if self.stats is not None:
+            for observer in observers:
+                self._call_timed(observer, observer.update, *reading)
+            return
+        for observer in observers:
+            observer.update(*reading)
+
+
+class ObserverStub(ObserverInterface):
+    def update(self, temperature, humidity, pressure):
+        pass
+
+
+class LiveSetWeatherData(WeatherData):
+    """
+    WeatherData with the original notify_observers, which loops over the
+    live observer set, for benchmark_concurrent_registry to compare against
+    """
+    def notify_observers(self, reading=None):
+        if reading is None:
+            reading = self.current_reading()
+        for observer in self.observers:
+            observer.update(*reading)
+
+
+def benchmark_concurrent_registry(weather_data_classes=(LiveSetWeatherData, WeatherData,
+                                                        CopyOnWriteWeatherData),
+                                  writers=4, seconds=1.0):
+    """
+    For each class, call set_measurements in a loop while `writers`
+    threads keep registering and removing observers
+    :return: dict of class name -> dict of notifications sent, observer
+             changes made and errors raised by set_measurements
+    """
+    return dict((weather_data_cls.__name__, _churn_registry(weather_data_cls, writers, seconds))
+                for weather_data_cls in weather_data_classes)
+
+
+def _churn_registry(weather_data_cls, writers, seconds):
+    weather_data = weather_data_cls()
+    for _ in range(100):
+        weather_data.register_observer(ObserverStub())
+    stop = threading.Event()
+    changes = [0] * writers
+
+    def churn(writer):
+        while not stop.is_set():
+            observer = ObserverStub()
+            weather_data.register_observer(observer)
+            weather_data.remove_observer(observer)
+            changes[writer] += 2
+
+    threads = [threading.Thread(target=churn, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    notifications = errors = 0
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            try:
+                weather_data.set_measurements(80, 65, 30.4)
+                notifications += 1
+            except RuntimeError:
+                errors += 1
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return {'notifications': notifications, 'observer_changes': sum(changes), 'errors': errors}
+
+
+if __name__ == "__main__":
+    # notify while other threads keep registering and removing observers
+    for name, result in sorted(benchmark_concurrent_registry(seconds=0.5).items()):
+        print("{}: {notifications} notifications, {observer_changes} observer changes, "
+              "{errors} errors".format(name, **result))
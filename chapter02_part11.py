@@ -0,0 +1,93 @@
+"""
+Chapter Two -- Observer Pattern
+
+The pull model.
+Each notification publishes an immutable, versioned snapshot of the
+measurements. Observers are only told the version number and read
+what they need from the snapshot.
+"""
+from collections import namedtuple
+
+from chapter02 import DisplayElementInterface, WeatherData
+
+
+class PullObserverInterface(object):
+    """
+    Observer that is only told there is a new version,
+    and pulls what it needs from the subject's snapshot
+    """
+    def update_version(self, version):
+        raise NotImplementedError
+
+
+WeatherSnapshot = namedtuple('WeatherSnapshot', ['version', 'temperature', 'humidity', 'pressure'])
+
+
+class PullWeatherData(WeatherData):
+    """
+    WeatherData for the pull model. Each notification publishes a new
+    immutable WeatherSnapshot that every observer shares, and observers
+    (registered or subscribed) only get its version number.
+    """
+    def __init__(self, **kwargs):
+        super(PullWeatherData, self).__init__(**kwargs)
+        self.snapshot = WeatherSnapshot(0, self.temperature, self.humidity, self.pressure)
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def notify_observers(self, reading=None):
+        if reading is None:
+            reading = self.current_reading()
+        self.snapshot = snapshot = WeatherSnapshot(self.snapshot.version + 1, *reading)
+        for observer in tuple(self.observers):
+            self._deliver(observer, observer.update_version, snapshot.version)
+
+    def _update_subscriber(self, observer, reading):
+        # measurements_changed has already published the snapshot
+        self._deliver(observer, observer.update_version, self.snapshot.version)
+
+    def set_measurements_batch(self, temps, humidities, pressures):
+        """
+        Publish one snapshot for the latest reading of the batch;
+        pull observers only ever see the current state
+        """
+        if not self._take_batch(temps, humidities, pressures):
+            return
+        self.measurements_changed()
+
+
+class PullCurrentConditionsDisplay(PullObserverInterface, DisplayElementInterface):
+    """
+    Current conditions for a PullWeatherData: skips versions it has
+    already seen and only reads the temperature and humidity
+    """
+    def __init__(self, weather_data):
+        self.version = 0
+        self.temperature = 0.0
+        self.humidity = 0.0
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    def update_version(self, version):
+        if version <= self.version:
+            return
+        snapshot = self.weather_data.snapshot
+        self.version = snapshot.version
+        self.temperature = snapshot.temperature
+        self.humidity = snapshot.humidity
+        self.display()
+
+    def display(self):
+        print("Current conditions: {} F degrees, {} % humidity (version {})"
+              .format(self.temperature, self.humidity, self.version))
+
+
+if __name__ == "__main__":
+    weather_data = PullWeatherData()
+    current_display = PullCurrentConditionsDisplay(weather_data)
+
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements_batch([78, 75], [90, 60], [29.2, 29.9])
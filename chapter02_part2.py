@@ -0,0 +1,149 @@
+"""
+Chapter Two -- Observer Pattern
+
+Observers in other processes.
+The publisher is a regular observer of WeatherData that writes each
+reading into a ring buffer in shared memory. Each worker process reads
+the ring and plays the subject for its own local observers.
+Nothing is pickled and there is no pipe per subscriber.
+"""
+from multiprocessing import shared_memory
+import struct
+import time
+
+from chapter02 import CurrentConditionsDisplay, ObserverInterface, SubjectInterface, WeatherData
+
+# header: last published sequence number, capacity
+_header = struct.Struct('<QQ')
+# slot: sequence number, temperature, humidity, pressure
+_slot = struct.Struct('<Qddd')
+
+
+class SharedMemoryPublisher(ObserverInterface):
+    """
+    Writes every reading of weather_data into a shared memory ring buffer.
+    Sequence numbers start at 1; reading n goes in slot n % capacity.
+    """
+    def __init__(self, weather_data, name=None, capacity=1024):
+        self.capacity = capacity
+        self.memory = shared_memory.SharedMemory(
+            name=name, create=True, size=_header.size + _slot.size * capacity)
+        self.sequence = 0
+        _header.pack_into(self.memory.buf, 0, self.sequence, capacity)
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def update(self, temperature, humidity, pressure):
+        sequence = self.sequence + 1
+        offset = _header.size + _slot.size * (sequence % self.capacity)
+        # mark the slot as being written, fill it in, then publish it
+        _slot.pack_into(self.memory.buf, offset, 0, temperature, humidity, pressure)
+        struct.pack_into('<Q', self.memory.buf, offset, sequence)
+        struct.pack_into('<Q', self.memory.buf, 0, sequence)
+        self.sequence = sequence
+
+    def close(self):
+        self.weather_data.remove_observer(self)
+        self.memory.close()
+        self.memory.unlink()
+
+
+class SharedMemorySubscriber(SubjectInterface):
+    """
+    Reads a publisher's ring buffer and updates local observers.
+    A subscriber that falls more than a ring behind has been lapped:
+    it counts the readings it missed and carries on from the oldest
+    reading still in the ring.
+    """
+    def __init__(self, name, start_at_latest=True):
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.observers = set()
+        published, self.capacity = _header.unpack_from(self.memory.buf, 0)
+        self.last_sequence = published if start_at_latest else 0
+        self.lapped_count = 0
+        self.missed_count = 0
+
+    def register_observer(self, observer):
+        self.observers.add(observer)
+
+    def remove_observer(self, observer):
+        try:
+            self.observers.remove(observer)
+        except KeyError:
+            pass
+
+    def notify_observers(self):
+        """
+        Update the observers with every reading published since the last call
+        :return: number of readings delivered
+        """
+        delivered = 0
+        published = struct.unpack_from('<Q', self.memory.buf, 0)[0]
+        while self.last_sequence < published:
+            sequence = self.last_sequence + 1
+            if published - sequence >= self.capacity:
+                self._lapped(published - self.capacity + 1)
+                continue
+
+            offset = _header.size + _slot.size * (sequence % self.capacity)
+            slot_sequence, temperature, humidity, pressure = _slot.unpack_from(self.memory.buf, offset)
+            # the slot was overwritten while we were reading it
+            if slot_sequence != sequence or struct.unpack_from('<Q', self.memory.buf, offset)[0] != sequence:
+                published = struct.unpack_from('<Q', self.memory.buf, 0)[0]
+                self._lapped(published - self.capacity + 1)
+                continue
+
+            self.last_sequence = sequence
+            for observer in self.observers:
+                observer.update(temperature, humidity, pressure)
+            delivered += 1
+        return delivered
+
+    def _lapped(self, oldest_sequence):
+        self.lapped_count += 1
+        self.missed_count += oldest_sequence - 1 - self.last_sequence
+        self.last_sequence = oldest_sequence - 1
+
+    def listen(self, stop_event, interval=0.001):
+        """
+        Poll the ring until stop_event is set
+        """
+        while not stop_event.is_set():
+            if not self.notify_observers():
+                time.sleep(interval)
+        self.notify_observers()
+
+    def close(self):
+        self.memory.close()
+
+
+def _display_worker(name, ready_event, stop_event):
+    subscriber = SharedMemorySubscriber(name)
+    CurrentConditionsDisplay(subscriber)
+    ready_event.set()
+    subscriber.listen(stop_event)
+    subscriber.close()
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    weather_data = WeatherData()
+    publisher = SharedMemoryPublisher(weather_data, capacity=16)
+
+    ready, stop = multiprocessing.Event(), multiprocessing.Event()
+    worker = multiprocessing.Process(target=_display_worker, args=(publisher.name, ready, stop))
+    worker.start()
+    ready.wait()
+
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements(78, 90, 29.2)
+
+    stop.set()
+    worker.join()
+    publisher.close()
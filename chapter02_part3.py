@@ -0,0 +1,152 @@
+"""
+Chapter Two -- Observer Pattern
+
+Recording and replaying sensor readings.
+The recorder writes every reading to a log of fixed-width
+binary records; the replay memory-maps the log and feeds it back into a
+WeatherData, as fast as it was recorded, faster, or as fast as it can.
+"""
+import mmap
+import os
+import struct
+import time
+
+from chapter02 import CurrentConditionsDisplay, WeatherData
+
+# timestamp, temperature, humidity, pressure
+_record = struct.Struct('<dddd')
+
+
+class SensorLogRecorder(object):
+    """
+    Wraps weather_data.set_measurements and set_measurements_batch so
+    every reading is appended to the log at path before it is passed on
+    (all the readings of a batch get the same timestamp).
+    Writes are buffered: call flush() before replaying a log that is
+    still being recorded. Only one recorder can wrap a WeatherData.
+    """
+    def __init__(self, weather_data, path, clock=time.time):
+        if isinstance(getattr(weather_data.set_measurements, '__self__', None), SensorLogRecorder):
+            raise ValueError('weather_data already has a SensorLogRecorder')
+        self.weather_data = weather_data
+        self.clock = clock
+        self.log_file = open(path, 'ab')
+        self._set_measurements = weather_data.set_measurements
+        self._set_measurements_batch = weather_data.set_measurements_batch
+        weather_data.set_measurements = self.set_measurements
+        weather_data.set_measurements_batch = self.set_measurements_batch
+
+    def set_measurements(self, temperature, humidity, pressure):
+        self.log_file.write(_record.pack(self.clock(), temperature, humidity, pressure))
+        self._set_measurements(temperature, humidity, pressure)
+
+    def set_measurements_batch(self, temps, humidities, pressures):
+        if len(humidities) == len(temps) == len(pressures):
+            timestamp = self.clock()
+            self.log_file.write(b''.join(_record.pack(timestamp, *reading)
+                                         for reading in zip(temps, humidities, pressures)))
+        self._set_measurements_batch(temps, humidities, pressures)
+
+    def flush(self):
+        self.log_file.flush()
+
+    def close(self):
+        if self.log_file.closed:
+            return
+        wrapped = vars(self.weather_data)
+        if wrapped.get('set_measurements') == self.set_measurements:
+            del self.weather_data.set_measurements
+        if wrapped.get('set_measurements_batch') == self.set_measurements_batch:
+            del self.weather_data.set_measurements_batch
+        self.log_file.close()
+
+
+class SensorLogReplay(object):
+    """
+    Replays a sensor log into a WeatherData. The log is memory-mapped
+    and records are unpacked one at a time as they are played.
+    It sees the records that were in the file when it was opened.
+    """
+    def __init__(self, path):
+        self._map = None
+        with open(path, 'rb') as log_file:
+            # an empty file can't be mapped; it's just an empty log
+            if os.fstat(log_file.fileno()).st_size:
+                self._map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.position = 0
+
+    def __len__(self):
+        return len(self._map) // _record.size if self._map is not None else 0
+
+    def timestamp(self, index):
+        return struct.unpack_from('<d', self._map, index * _record.size)[0]
+
+    def seek(self, timestamp):
+        """
+        Move to the first record at or after timestamp (binary search,
+        the log is in time order)
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        self.position = low
+
+    def play(self, weather_data, speed=1.0, until=None):
+        """
+        Feed the records from the current position into weather_data.
+        speed=1.0 is real time, 2.0 twice as fast, None as fast as possible.
+        Stop before the first record after until, if given.
+        :return: number of records played
+        """
+        if self._map is None:
+            return 0
+        records = memoryview(self._map)[self.position * _record.size:len(self) * _record.size]
+        played = 0
+        first_timestamp = started = None
+        try:
+            for timestamp, temperature, humidity, pressure in _record.iter_unpack(records):
+                if until is not None and timestamp > until:
+                    break
+                if speed:
+                    if first_timestamp is None:
+                        first_timestamp, started = timestamp, time.monotonic()
+                    delay = (timestamp - first_timestamp) / speed - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                weather_data.set_measurements(temperature, humidity, pressure)
+                played += 1
+        finally:
+            records.release()
+            # records already played are not played again, even if one raised
+            self.position += played
+        return played
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    log_path = os.path.join(tempfile.mkdtemp(), 'sensor.log')
+
+    # record a few readings...
+    weather_data = WeatherData()
+    recorder = SensorLogRecorder(weather_data, log_path)
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements(78, 90, 29.2)
+    recorder.close()
+
+    # ...and play them back to a display
+    replay_data = WeatherData()
+    current_display = CurrentConditionsDisplay(replay_data)
+    replay = SensorLogReplay(log_path)
+    print("Replaying {} readings".format(len(replay)))
+    replay.play(replay_data, speed=None)
+    replay.close()
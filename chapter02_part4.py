@@ -0,0 +1,133 @@
+"""
+Chapter Two -- Observer Pattern
+
+The weather station on asyncio.
+Observers have an `async def update`, they are all notified concurrently,
+and readings can be consumed with `async for reading in station.stream()`.
+"""
+import asyncio
+from collections import namedtuple
+
+from chapter02 import DisplayElementInterface, SubjectInterface
+
+Reading = namedtuple('Reading', ['temperature', 'humidity', 'pressure'])
+
+
+class AsyncObserverInterface(object):
+    async def update(self, temp, humidity, pressure):
+        raise NotImplementedError
+
+
+class AsyncWeatherData(SubjectInterface):
+    """
+    Weather station subject for asyncio code. Observer errors are
+    kept in self.errors instead of stopping the other observers.
+    """
+    def __init__(self):
+        self.observers = set()
+        self.temperature = 0.0
+        self.humidity = 0.0
+        self.pressure = 0.0
+        self.errors = []
+        self._streams = set()
+
+    def register_observer(self, observer):
+        self.observers.add(observer)
+
+    def remove_observer(self, observer):
+        try:
+            self.observers.remove(observer)
+        except KeyError:
+            pass
+
+    async def notify_observers(self):
+        reading = Reading(self.temperature, self.humidity, self.pressure)
+        for queue in self._streams:
+            if queue.full():
+                # a slow stream only misses its oldest reading
+                queue.get_nowait()
+            queue.put_nowait(reading)
+
+        observers = list(self.observers)
+        results = await asyncio.gather(
+            *[observer.update(*reading) for observer in observers], return_exceptions=True)
+        self.errors = [(observer, result) for observer, result in zip(observers, results)
+                       if isinstance(result, Exception)]
+
+    async def measurements_changed(self):
+        await self.notify_observers()
+
+    async def set_measurements(self, temperature, humidity, pressure):
+        self.temperature = temperature
+        self.pressure = pressure
+        self.humidity = humidity
+        await self.measurements_changed()
+
+    def stream(self, maxsize=0):
+        """
+        Return an async iterator of every reading from the moment stream()
+        is called, until close() is called. With maxsize set, a slow
+        consumer drops its oldest readings. Readings are kept for the
+        stream until it is iterated to the end.
+        """
+        queue = asyncio.Queue(maxsize)
+        self._streams.add(queue)
+
+        async def readings():
+            try:
+                while True:
+                    reading = await queue.get()
+                    if reading is None:
+                        return
+                    yield reading
+            finally:
+                self._streams.discard(queue)
+        return readings()
+
+    def close(self):
+        """
+        End all the streams
+        """
+        for queue in self._streams:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+class AsyncCurrentConditionsDisplay(AsyncObserverInterface, DisplayElementInterface):
+    def __init__(self, weather_data):
+        self.temperature = 0.0
+        self.humidity = 0.0
+        self.weather_data = weather_data
+        self.weather_data.register_observer(self)
+
+    async def update(self, temperature, humidity, pressure):
+        self.temperature = temperature
+        self.humidity = humidity
+        self.display()
+
+    def display(self):
+        print("Current conditions: {} F degrees, {} % humidity"
+              .format(self.temperature, self.humidity))
+
+
+async def main():
+    weather_data = AsyncWeatherData()
+    AsyncCurrentConditionsDisplay(weather_data)
+
+    async def print_pressure(readings):
+        async for reading in readings:
+            print("Pressure: {}".format(reading.pressure))
+
+    printer = asyncio.ensure_future(print_pressure(weather_data.stream()))
+
+    await weather_data.set_measurements(80, 65, 30.4)
+    await weather_data.set_measurements(82, 70, 29.2)
+    await weather_data.set_measurements(78, 90, 29.2)
+
+    weather_data.close()
+    await printer
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
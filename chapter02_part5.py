@@ -0,0 +1,182 @@
+"""
+Chapter Two -- Observer Pattern
+
+Lots of weather stations.
+Instead of one subject per station, the registry keeps the readings of
+every station in columns (one typed array per measurement per region).
+Observers watch regions, not stations: on each publish they get one
+rollup per region, computed over the whole column at once.
+"""
+from array import array
+
+from chapter02 import DisplayElementInterface, SubjectInterface
+
+
+class RegionObserverInterface(object):
+    def update_region(self, region, rollup):
+        raise NotImplementedError
+
+
+class RegionColumns(object):
+    """
+    The readings of every station in one region
+    """
+    def __init__(self):
+        self.station_ids = []
+        self.temperatures = array('d')
+        self.humidities = array('d')
+        self.pressures = array('d')
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def add_station(self, station_id):
+        self.station_ids.append(station_id)
+        self.temperatures.append(0.0)
+        self.humidities.append(0.0)
+        self.pressures.append(0.0)
+        return len(self.station_ids) - 1
+
+    def rollup(self):
+        """
+        :return: dict of station count, and mean/min/max of each measurement
+        """
+        count = len(self.station_ids)
+        rollup = {'stations': count}
+        for name, column in (('temperature', self.temperatures),
+                             ('humidity', self.humidities),
+                             ('pressure', self.pressures)):
+            rollup['mean_' + name] = sum(column) / count if count else 0.0
+            rollup['min_' + name] = min(column) if count else 0.0
+            rollup['max_' + name] = max(column) if count else 0.0
+        return rollup
+
+
+class StationRegistry(SubjectInterface):
+    """
+    Holds many stations grouped by region. Setting measurements only
+    writes to the columns; observers hear about it on notify_observers().
+    """
+    def __init__(self):
+        self.regions = {}
+        self.stations = {}
+        self.observers = {}
+
+    def add_station(self, station_id, region):
+        if station_id in self.stations:
+            raise ValueError('station {!r} already registered'.format(station_id))
+        columns = self.regions.setdefault(region, RegionColumns())
+        self.stations[station_id] = (columns, columns.add_station(station_id))
+
+    def register_observer(self, observer, regions=None):
+        """
+        Watch the given regions, or every region if regions is None
+        """
+        self.observers[observer] = set(regions) if regions is not None else None
+
+    def remove_observer(self, observer):
+        self.observers.pop(observer, None)
+
+    def set_measurements(self, station_id, temperature, humidity, pressure):
+        columns, index = self.stations[station_id]
+        columns.temperatures[index] = temperature
+        columns.humidities[index] = humidity
+        columns.pressures[index] = pressure
+
+    def set_region_measurements(self, region, temps, humidities, pressures):
+        """
+        Replace the readings of every station in region at once.
+        The sequences are in the order the stations were added.
+        """
+        columns = self.regions[region]
+        for column, values in ((columns.temperatures, temps),
+                               (columns.humidities, humidities),
+                               (columns.pressures, pressures)):
+            if len(values) != len(columns):
+                raise ValueError('expected {} readings for region {!r}, got {}'
+                                 .format(len(columns), region, len(values)))
+            column[:] = values if isinstance(values, array) else array('d', values)
+
+    def notify_observers(self):
+        """
+        Compute each watched region's rollup once and send it to its observers
+        """
+        rollups = {}
+        for observer, regions in list(self.observers.items()):
+            for region in (self.regions if regions is None else regions):
+                if region not in rollups:
+                    rollups[region] = self.regions[region].rollup()
+                observer.update_region(region, rollups[region])
+
+
+class RegionDisplay(RegionObserverInterface, DisplayElementInterface):
+    def __init__(self, registry, regions=None):
+        self.region = None
+        self.rollup = None
+        self.registry = registry
+        self.registry.register_observer(self, regions)
+
+    def update_region(self, region, rollup):
+        self.region = region
+        self.rollup = rollup
+        self.display()
+
+    def display(self):
+        print("{}: {} stations, {:.1f} F avg ({} - {}), {:.1f} in avg pressure"
+              .format(self.region, self.rollup['stations'], self.rollup['mean_temperature'],
+                      self.rollup['min_temperature'], self.rollup['max_temperature'],
+                      self.rollup['mean_pressure']))
+
+
+def benchmark_ingest(stations=10000, regions=10, ticks=1000, publish_every=1):
+    """
+    Ingest `ticks` rounds of readings from every station (1000 ticks is
+    one second at 1 kHz), writing each region's readings in one call and
+    publishing rollups every publish_every ticks
+    :return: dict of readings, seconds, readings per second and achieved tick rate
+    """
+    import random
+    import time
+
+    registry = StationRegistry()
+    for station in range(stations):
+        registry.add_station(station, 'region {}'.format(station % regions))
+
+    class RollupCounter(RegionObserverInterface):
+        rollups = 0
+
+        def update_region(self, region, rollup):
+            self.rollups += 1
+    registry.register_observer(RollupCounter())
+
+    readings = {}
+    for region, columns in registry.regions.items():
+        readings[region] = tuple(array('d', (random.uniform(low, high) for _ in range(len(columns))))
+                                 for low, high in ((0, 100), (0, 100), (28, 32)))
+
+    started = time.perf_counter()
+    for tick in range(ticks):
+        for region, (temps, humidities, pressures) in readings.items():
+            registry.set_region_measurements(region, temps, humidities, pressures)
+        if tick % publish_every == 0:
+            registry.notify_observers()
+    seconds = time.perf_counter() - started
+
+    return {
+        'readings': stations * ticks,
+        'seconds': seconds,
+        'readings_per_second': stations * ticks / seconds,
+        'ticks_per_second': ticks / seconds,
+    }
+
+
+if __name__ == "__main__":
+    registry = StationRegistry()
+    for station_id, region in (('BOS', 'east'), ('NYC', 'east'), ('SEA', 'west'), ('SFO', 'west')):
+        registry.add_station(station_id, region)
+    region_display = RegionDisplay(registry)
+
+    registry.set_measurements('BOS', 70, 65, 30.1)
+    registry.set_measurements('NYC', 80, 70, 29.9)
+    registry.set_region_measurements('west', [60, 68], [80, 75], [30.2, 30.0])
+    registry.notify_observers()
@@ -0,0 +1,146 @@
+"""
+Chapter Two -- Observer Pattern
+
+Keeping every reading.
+The store is an observer that appends each reading to one file per
+column (time, temperature, humidity, pressure) of little-endian doubles.
+A sparse index of every Nth timestamp narrows down range queries, which
+hand back views straight into the memory-mapped files.
+"""
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from chapter02 import ObserverInterface, WeatherData
+
+_double = struct.Struct('<d')
+# index entry: timestamp, row number
+_index_entry = struct.Struct('<dQ')
+
+
+class MeasurementStore(ObserverInterface):
+    """
+    Append-only columnar store of the readings of weather_data.
+    Rows must arrive in time order.
+    """
+    columns = ('time', 'temperature', 'humidity', 'pressure')
+
+    def __init__(self, directory, weather_data=None, index_every=1024, clock=time.time):
+        if sys.byteorder != 'little':
+            raise RuntimeError('MeasurementStore only supports little-endian machines')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.index_every = index_every
+        self.clock = clock
+        self.files = dict((column, open(self._path(column), 'ab')) for column in self.columns)
+        self.index_file = open(self._path('time', '.idx'), 'ab')
+
+        self.rows = os.path.getsize(self._path('time')) // _double.size
+        self.index = self._read_index()
+
+        self.weather_data = weather_data
+        if weather_data is not None:
+            weather_data.register_observer(self)
+
+    def _path(self, column, extension='.f64'):
+        return os.path.join(self.directory, column + extension)
+
+    def _read_index(self):
+        with open(self._path('time', '.idx'), 'rb') as index_file:
+            return [entry for entry in _index_entry.iter_unpack(index_file.read())]
+
+    def __len__(self):
+        return self.rows
+
+    def update(self, temperature, humidity, pressure):
+        self.append(self.clock(), temperature, humidity, pressure)
+
+    def append(self, timestamp, temperature, humidity, pressure):
+        if self.rows % self.index_every == 0:
+            self.index_file.write(_index_entry.pack(timestamp, self.rows))
+            self.index.append((timestamp, self.rows))
+        for column, value in zip(self.columns, (timestamp, temperature, humidity, pressure)):
+            self.files[column].write(_double.pack(value))
+        self.rows += 1
+
+    def flush(self):
+        for column_file in self.files.values():
+            column_file.flush()
+        self.index_file.flush()
+
+    def _column(self, column):
+        """
+        Map a column file and return a memoryview of its doubles
+        """
+        if not self.rows:
+            return memoryview(array('d'))
+        with open(self._path(column), 'rb') as column_file:
+            column_map = mmap.mmap(column_file.fileno(), self.rows * _double.size,
+                                   access=mmap.ACCESS_READ)
+        return memoryview(column_map).cast('d')
+
+    def _find_row(self, times, timestamp):
+        """
+        Return the first row at or after timestamp
+        """
+        block = max(0, bisect_left(self.index, (timestamp, -1)) - 1)
+        low = self.index[block][1] if self.index else 0
+        high = self.index[block + 1][1] if block + 1 < len(self.index) else self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if times[middle] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start, end):
+        """
+        Return the readings with start <= time < end as a dict of
+        column -> view into the mapped file (a NumPy array if NumPy is
+        installed, a memoryview otherwise). Nothing is copied.
+        """
+        self.flush()
+        times = self._column('time')
+        first = self._find_row(times, start)
+        last = self._find_row(times, end)
+
+        result = {}
+        for column in self.columns:
+            view = (times if column == 'time' else self._column(column))[first:last]
+            result[column] = numpy.frombuffer(view, dtype='<f8') if numpy is not None else view
+        return result
+
+    def close(self):
+        if self.weather_data is not None:
+            self.weather_data.remove_observer(self)
+        for column_file in self.files.values():
+            column_file.close()
+        self.index_file.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    weather_data = WeatherData()
+    clock = iter(range(100)).__next__
+    store = MeasurementStore(tempfile.mkdtemp(), weather_data, index_every=2, clock=clock)
+
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements(78, 90, 29.2)
+    weather_data.set_measurements(75, 60, 29.9)
+
+    readings = store.query(1, 3)
+    print("Temperatures from t=1 to t=3: {}".format(list(readings['temperature'])))
+    store.close()
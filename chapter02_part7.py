@@ -0,0 +1,171 @@
+"""
+Chapter Two -- Observer Pattern
+
+Notifying observers in parallel.
+ParallelWeatherData hands every observer's update to a concurrent.futures
+executor, so one slow observer doesn't hold up the others. With a process
+pool, the work runs in worker processes and only the results come back.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import time
+import weakref
+
+from chapter02 import BatchObserverInterface, HeatIndexDisplay, ProcessObserverInterface, WeatherData
+
+
+class ParallelWeatherData(WeatherData):
+    """
+    WeatherData that notifies its observers on an executor
+    (a thread pool by default, or any concurrent.futures executor),
+    so one slow observer doesn't hold up the others. Subscribers
+    (see subscribe()) run on the executor too.
+
+    A process pool can't call update() on the observers themselves
+    (they hold locks, and a copy's state would be thrown away), so with
+    a ProcessPoolExecutor only ProcessObserverInterface observers are
+    accepted: their worker_function gets the reading in the worker and
+    update_result() gets the answer back in this process.
+    """
+    def __init__(self, executor=None, max_workers=None, timeout=None, wait=True, **kwargs):
+        if kwargs.get('instrument'):
+            raise ValueError('ParallelWeatherData does not support instrument')
+        super(ParallelWeatherData, self).__init__(**kwargs)
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+        self.use_processes = isinstance(self.executor, ProcessPoolExecutor)
+        self.timeout = timeout
+        self.observer_timeouts = weakref.WeakKeyDictionary()
+        self.wait = wait
+        self.errors = []
+        self.timed_out = []
+
+    def register_observer(self, observer, timeout=None):
+        if self.use_processes and not isinstance(observer, ProcessObserverInterface):
+            raise ValueError('with a process pool, observers must implement ProcessObserverInterface')
+        super(ParallelWeatherData, self).register_observer(observer)
+        if timeout is not None:
+            self.observer_timeouts[observer] = timeout
+
+    def remove_observer(self, observer):
+        super(ParallelWeatherData, self).remove_observer(observer)
+        self.observer_timeouts.pop(observer, None)
+
+    def subscribe(self, observer, fields, condition=None):
+        if self.use_processes and not isinstance(observer, ProcessObserverInterface):
+            raise ValueError('with a process pool, observers must implement ProcessObserverInterface')
+        super(ParallelWeatherData, self).subscribe(observer, fields, condition)
+
+    def _submit(self, observer, reading):
+        if isinstance(observer, ProcessObserverInterface):
+            future = self.executor.submit(observer.worker_function, *reading)
+            return observer, future, observer.update_result
+        return observer, self.executor.submit(observer.update, *reading), None
+
+    def notify_observers(self, reading=None):
+        """
+        Start every observer's update. If wait is set, wait for them to
+        finish, each within its own timeout, and keep the errors and
+        timeouts instead of raising them.
+        """
+        if reading is None:
+            reading = self.current_reading()
+        self._collect([self._submit(observer, reading) for observer in list(self.observers)])
+
+    def notify_subscribers(self, reading=None):
+        """
+        Like notify_observers, for the subscribers of the fields that changed
+        """
+        if reading is None:
+            reading = self.current_reading()
+        self._collect([self._submit(observer, reading)
+                       for observer in self._changed_subscribers(reading)])
+
+    def measurements_changed(self, reading=None):
+        # observers and subscribers run side by side and are waited for together
+        if reading is None:
+            reading = self.current_reading()
+        observers = list(self.observers) + self._changed_subscribers(reading)
+        self._collect([self._submit(observer, reading) for observer in observers])
+
+    def set_measurements_batch(self, temps, humidities, pressures):
+        """
+        Like WeatherData.set_measurements_batch, but each observer
+        gets the batch on the executor
+        """
+        if not self._take_batch(temps, humidities, pressures):
+            return
+
+        tasks = []
+        for observer in list(self.observers):
+            if isinstance(observer, ProcessObserverInterface):
+                future = self.executor.submit(
+                    _run_worker_batch, observer.worker_function, temps, humidities, pressures)
+                tasks.append((observer, future, _apply_results(observer.update_result)))
+            elif isinstance(observer, BatchObserverInterface):
+                future = self.executor.submit(observer.update_batch, temps, humidities, pressures)
+                tasks.append((observer, future, None))
+            else:
+                future = self.executor.submit(_update_each, observer, temps, humidities, pressures)
+                tasks.append((observer, future, None))
+        reading = self.current_reading()
+        tasks.extend(self._submit(observer, reading)
+                     for observer in self._changed_subscribers(reading))
+        self._collect(tasks)
+
+    def _collect(self, tasks):
+        """
+        Hand worker results back to their observers, in this process.
+        Without wait this happens in a callback when each task is done,
+        and errors are dropped.
+        """
+        if not self.wait:
+            for observer, future, on_result in tasks:
+                if on_result is not None:
+                    future.add_done_callback(
+                        lambda done, on_result=on_result: done.exception() or on_result(done.result()))
+            return
+
+        started = time.monotonic()
+        self.errors = []
+        self.timed_out = []
+        for observer, future, on_result in tasks:
+            timeout = self.observer_timeouts.get(observer, self.timeout)
+            if timeout is not None:
+                timeout = max(0.0, started + timeout - time.monotonic())
+            try:
+                result = future.result(timeout=timeout)
+                if on_result is not None:
+                    on_result(result)
+            except TimeoutError:
+                self.timed_out.append(observer)
+            except Exception as error:
+                self.errors.append((observer, error))
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def _update_each(observer, temps, humidities, pressures):
+    for reading in zip(temps, humidities, pressures):
+        observer.update(*reading)
+
+
+def _run_worker_batch(worker_function, temps, humidities, pressures):
+    return [worker_function(*reading) for reading in zip(temps, humidities, pressures)]
+
+
+def _apply_results(update_result):
+    def apply(results):
+        for result in results:
+            update_result(result)
+    return apply
+
+
+if __name__ == "__main__":
+    # work the heat index out in another process
+    weather_data = ParallelWeatherData(executor=ProcessPoolExecutor(max_workers=1))
+    heat_index_display = HeatIndexDisplay(weather_data)
+
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements_batch([78, 75], [90, 60], [29.2, 29.9])
+    weather_data.shutdown()
@@ -0,0 +1,202 @@
+"""
+Chapter Two -- Observer Pattern
+
+Slow observers on their own threads.
+Every observer gets a bounded queue of readings and a consumer thread
+that calls it, and an overflow policy decides what happens to the
+readings when the observer falls behind.
+"""
+from collections import deque
+import threading
+
+from chapter02 import CurrentConditionsDisplay, WeatherData
+
+
+class ObserverQueue(object):
+    """
+    Bounded queue of readings for one observer, with its own consumer
+    thread calling the observer's update().
+
+    When the queue is full the policy decides what happens:
+    'block' waits for room, 'drop_oldest' throws away the oldest reading,
+    'drop_newest' throws away the new one, and 'latest' only ever keeps
+    the newest reading.
+    """
+    policies = ('block', 'drop_oldest', 'drop_newest', 'latest')
+
+    def __init__(self, observer, capacity=64, policy='drop_oldest'):
+        if policy not in self.policies:
+            raise ValueError('unknown overflow policy {!r}'.format(policy))
+        self.observer = observer
+        self.capacity = capacity
+        self.policy = policy
+        self.readings = deque()
+        self.dropped = 0
+        self.delivered = 0
+        self.errors = 0
+        self.closed = False
+        self._busy = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return len(self.readings)
+
+    def put(self, reading):
+        with self._condition:
+            if self.policy == 'latest':
+                self.dropped += len(self.readings)
+                self.readings.clear()
+            elif len(self.readings) >= self.capacity:
+                if self.policy == 'block':
+                    while len(self.readings) >= self.capacity and not self.closed:
+                        self._condition.wait()
+                elif self.policy == 'drop_oldest':
+                    self.readings.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return
+            self.readings.append(reading)
+            self._condition.notify_all()
+
+    def _consume(self):
+        while True:
+            with self._condition:
+                while not self.readings and not self.closed:
+                    self._condition.wait()
+                if not self.readings:
+                    return
+                reading = self.readings.popleft()
+                self._busy = True
+                self._condition.notify_all()
+
+            try:
+                self.observer.update(*reading)
+            except Exception:
+                self.errors += 1
+
+            with self._condition:
+                self._busy = False
+                self.delivered += 1
+                self._condition.notify_all()
+
+    def join(self):
+        """
+        Wait until every queued reading has been delivered
+        """
+        with self._condition:
+            while self.readings or self._busy:
+                self._condition.wait()
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+
+class QueuedWeatherData(WeatherData):
+    """
+    WeatherData that gives each observer its own bounded queue and
+    consumer thread, so a slow observer never holds up set_measurements
+    or set_measurements_batch (unless its policy is 'block').
+
+    Subscribers (see subscribe()) get a queue of their own too.
+
+    The consumer threads hold on to their observers, so weak_observers
+    is not supported; call remove_observer(), unsubscribe() or close().
+    """
+    def __init__(self, capacity=64, policy='drop_oldest', **kwargs):
+        for option in ('weak_observers', 'instrument'):
+            if kwargs.get(option):
+                raise ValueError('QueuedWeatherData does not support {}'.format(option))
+        super(QueuedWeatherData, self).__init__(**kwargs)
+        self.capacity = capacity
+        self.policy = policy
+        self.queues = {}
+        self.subscriber_queues = {}
+
+    def register_observer(self, observer, capacity=None, policy=None):
+        if observer in self.queues:
+            return
+        super(QueuedWeatherData, self).register_observer(observer)
+        self.queues[observer] = ObserverQueue(
+            observer, capacity or self.capacity, policy or self.policy)
+
+    def remove_observer(self, observer):
+        super(QueuedWeatherData, self).remove_observer(observer)
+        queue = self.queues.pop(observer, None)
+        if queue:
+            queue.close()
+
+    def subscribe(self, observer, fields, condition=None, capacity=None, policy=None):
+        super(QueuedWeatherData, self).subscribe(observer, fields, condition)
+        if observer not in self.subscriber_queues:
+            self.subscriber_queues[observer] = ObserverQueue(
+                observer, capacity or self.capacity, policy or self.policy)
+
+    def unsubscribe(self, observer):
+        super(QueuedWeatherData, self).unsubscribe(observer)
+        queue = self.subscriber_queues.pop(observer, None)
+        if queue:
+            queue.close()
+
+    def notify_observers(self, reading=None):
+        if reading is None:
+            reading = self.current_reading()
+        for queue in list(self.queues.values()):
+            queue.put(reading)
+
+    def _update_subscriber(self, observer, reading):
+        queue = self.subscriber_queues.get(observer)
+        if queue is not None:
+            queue.put(reading)
+
+    def set_measurements_batch(self, temps, humidities, pressures):
+        """
+        Put every reading of the batch on every observer's queue;
+        the consumer threads deliver them one update() at a time
+        """
+        if not self._take_batch(temps, humidities, pressures):
+            return
+
+        readings = list(zip(temps, humidities, pressures))
+        for queue in list(self.queues.values()):
+            for reading in readings:
+                queue.put(reading)
+        self.notify_subscribers()
+
+    def metrics(self):
+        """
+        :return: dict of observer -> dict of queue depth, dropped,
+                 delivered and error counts
+        """
+        return dict((observer, {'depth': queue.depth, 'dropped': queue.dropped,
+                                'delivered': queue.delivered, 'errors': queue.errors})
+                    for observer, queue in self.queues.items())
+
+    def join(self):
+        for queue in list(self.queues.values()) + list(self.subscriber_queues.values()):
+            queue.join()
+
+    def close(self):
+        for observer in list(self.queues):
+            self.remove_observer(observer)
+        for observer in list(self.subscriber_queues):
+            self.unsubscribe(observer)
+
+
+if __name__ == "__main__":
+    weather_data = QueuedWeatherData(capacity=8, policy='drop_oldest')
+    current_display = CurrentConditionsDisplay(weather_data)
+
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements(78, 90, 29.2)
+
+    weather_data.join()
+    print(weather_data.metrics()[current_display])
+    weather_data.close()
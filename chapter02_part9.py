@@ -0,0 +1,118 @@
+"""
+Chapter Two -- Observer Pattern
+
+Watching the observers.
+ObserverStats keeps the update latency histogram, call count and
+exception count of every observer of a WeatherData(instrument=True),
+and writes them out in the Prometheus text format.
+"""
+import threading
+import weakref
+
+
+def _label_value(value):
+    """
+    Escape a Prometheus label value (backslash, double quote and newline)
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ObserverStats(object):
+    """
+    Per-observer update() latency histograms, call counts and exception counts.
+
+    Observers are labelled by their `name` attribute if they have one
+    (observers sharing a name share their stats), otherwise by class name
+    and a per-class number given in the order they are first seen,
+    e.g. 'CurrentConditionsDisplay#2'. Labels are never reused.
+    """
+    # histogram bucket upper bounds, in seconds
+    buckets = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, float('inf'))
+
+    def __init__(self):
+        self.observers = {}
+        self._labels = weakref.WeakKeyDictionary()
+        self._class_counts = {}
+        self._lock = threading.Lock()
+
+    def label(self, observer):
+        try:
+            return self._labels[observer]
+        except KeyError:
+            pass
+        except TypeError:
+            # can't be weakly referenced, so can't be told apart from its class
+            return getattr(observer, 'name', None) or type(observer).__name__
+        label = getattr(observer, 'name', None)
+        if not isinstance(label, str):
+            cls_name = type(observer).__name__
+            self._class_counts[cls_name] = count = self._class_counts.get(cls_name, 0) + 1
+            label = '{}#{}'.format(cls_name, count)
+        self._labels[observer] = label
+        return label
+
+    def record(self, observer, seconds, failed=False):
+        with self._lock:
+            label = self.label(observer)
+            stats = self.observers.get(label)
+            if stats is None:
+                stats = self.observers[label] = {
+                    'calls': 0, 'exceptions': 0, 'seconds': 0.0,
+                    'histogram': [0] * len(self.buckets)}
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if failed:
+                stats['exceptions'] += 1
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats['histogram'][index] += 1
+                    break
+
+    def snapshot(self):
+        """
+        :return: copy of the stats, observer label -> dict of calls,
+                 exceptions, total seconds, bucket counts, and whether
+                 an observer with that label is still alive
+        """
+        with self._lock:
+            alive = set(self._labels.values())
+            return dict((label, dict(stats, histogram=list(stats['histogram']), alive=label in alive))
+                        for label, stats in self.observers.items())
+
+    def prometheus_text(self):
+        snapshot = [(_label_value(label), stats) for label, stats in sorted(self.snapshot().items())]
+        lines = ['# TYPE weather_observer_update_seconds histogram']
+        for label, stats in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, stats['histogram']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('weather_observer_update_seconds_bucket{{observer="{}",le="{}"}} {}'
+                             .format(label, le, cumulative))
+            lines.append('weather_observer_update_seconds_sum{{observer="{}"}} {}'
+                         .format(label, stats['seconds']))
+            lines.append('weather_observer_update_seconds_count{{observer="{}"}} {}'
+                         .format(label, stats['calls']))
+
+        lines.append('# TYPE weather_observer_update_exceptions_total counter')
+        for label, stats in snapshot:
+            lines.append('weather_observer_update_exceptions_total{{observer="{}"}} {}'
+                         .format(label, stats['exceptions']))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as stats_file:
+            stats_file.write(self.prometheus_text())
+
+
+if __name__ == "__main__":
+    from chapter02 import CurrentConditionsDisplay, StatisticsDisplay, WeatherData
+
+    weather_data = WeatherData(instrument=True)
+    current_display = CurrentConditionsDisplay(weather_data)
+    statistics_display = StatisticsDisplay(weather_data)
+
+    weather_data.set_measurements(80, 65, 30.4)
+    weather_data.set_measurements(82, 70, 29.2)
+    weather_data.set_measurements(78, 90, 29.2)
+    print(weather_data.stats.prometheus_text())
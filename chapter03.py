@@ -32,8 +32,14 @@ class CondimentDecorator(Beverage):
     """
     Decorator class that extends beverage class
     """
+    # what the condiment adds to the cost of the beverage it wraps
+    price = None
+
     def get_description(self):
-        raise NotImplementedError
+        return "{}, {}".format(self.beverage.get_description(), self.description)
+
+    def cost(self):
+        return self.price + self.beverage.cost()
 
 
 # ------------------------
@@ -43,45 +49,44 @@ class Mocha(CondimentDecorator):
     """
     Class to add Mocha option
     """
+    price = 0.20
+
     def __init__(self, beverage):
         self.description = "Mocha"
         self.beverage = beverage
 
-    def get_description(self):
-        return "{}, {}".format(self.beverage.get_description(), self.description)
-
-    def cost(self):
-        return 0.20 + self.beverage.cost()
-
 
 class Soy(CondimentDecorator):
     """
     Class to add Soy option
     """
+    price = 0.50
+
     def __init__(self, beverage):
         self.description = "Soy"
         self.beverage = beverage
 
-    def get_description(self):
-        return "{}, {}".format(self.beverage.get_description(), self.description)
-
-    def cost(self):
-        return 0.50 + self.beverage.cost()
-
 
 class Whip(CondimentDecorator):
     """
     Class to add Whip option
     """
+    price = 0.10
+
     def __init__(self, beverage):
         self.description = "Whip"
         self.beverage = beverage
 
+
+class DoubleMocha(Mocha):
+    """
+    Class to add two shots of Mocha
+    """
     def get_description(self):
-        return "{}, {}".format(self.beverage.get_description(), self.description)
+        return "{}, Double {}".format(self.beverage.get_description(), self.description)
 
     def cost(self):
-        return 0.10 + self.beverage.cost()
+        return 2 * self.price + self.beverage.cost()
 
 
 # ------------------------
@@ -131,6 +136,122 @@ class Decaf(Beverage):
         return 1.00
 
 
+# ------------------------
+# Iterative Evaluation
+# ------------------------
+# cost() and get_description() recurse once per condiment, so a few
+# thousand condiments hit the recursion limit. These walk the chain instead.
+def _unwrap(beverage, method):
+    """
+    Walk down the condiment chain while the condiments use the stock
+    CondimentDecorator method (so all they add is their price or description)
+    :return: (list of condiments from the outside in, the beverage under them)
+    """
+    stock = getattr(CondimentDecorator, method)
+    condiments = []
+    while isinstance(beverage, CondimentDecorator) and getattr(type(beverage), method) is stock:
+        condiments.append(beverage)
+        beverage = beverage.beverage
+    return condiments, beverage
+
+
+def evaluate_cost(beverage):
+    """
+    Return the cost of the beverage without recursing
+    :return: float
+    """
+    condiments, beverage = _unwrap(beverage, 'cost')
+    # add the prices from the inside out, in the same order cost() would
+    total = beverage.cost()
+    for condiment in reversed(condiments):
+        total = condiment.price + total
+    return total
+
+
+def evaluate_description(beverage):
+    """
+    Return the description of the beverage without recursing
+    :return: string
+    """
+    condiments, beverage = _unwrap(beverage, 'get_description')
+    descriptions = [beverage.get_description()]
+    descriptions.extend(condiment.description for condiment in reversed(condiments))
+    return ', '.join(descriptions)
+
+
+def benchmark_depth(depths=(1, 10, 100, 1000, 10000, 100000)):
+    """
+    Time cost() plus get_description() on Espresso with `depth` Mochas,
+    recursively and iteratively
+    :return: dict of depth -> (recursive seconds or None if it hit the
+             recursion limit, iterative seconds)
+    """
+    import time
+
+    results = {}
+    for depth in depths:
+        beverage = Espresso()
+        for _ in range(depth):
+            beverage = Mocha(beverage)
+
+        try:
+            started = time.perf_counter()
+            beverage.cost()
+            beverage.get_description()
+            recursive = time.perf_counter() - started
+        except RecursionError:
+            recursive = None
+
+        started = time.perf_counter()
+        evaluate_cost(beverage)
+        evaluate_description(beverage)
+        results[depth] = (recursive, time.perf_counter() - started)
+    return results
+
+
+# ------------------------
+# Compiled Beverages
+# ------------------------
+class CompiledBeverage(Beverage):
+    """
+    Wraps a finished beverage and works out its cost and description
+    once (with the iterative evaluators), instead of walking the whole
+    condiment chain on every call. Condiments with their own cost() or
+    get_description() are asked directly, so the cached values are always
+    what the beverage itself would say.
+    """
+    def __init__(self, beverage):
+        self.beverage = beverage
+        self._cost = None
+        self.description = None
+
+    def invalidate(self):
+        """
+        Forget the cached cost and description
+        """
+        self._cost = None
+        self.description = None
+
+    def wrap(self, condiment_cls):
+        """
+        Add a condiment to the beverage and drop the cache
+        :return: self, so calls can be chained
+        """
+        self.beverage = condiment_cls(self.beverage)
+        self.invalidate()
+        return self
+
+    def get_description(self):
+        if self.description is None:
+            self.description = evaluate_description(self.beverage)
+        return self.description
+
+    def cost(self):
+        if self._cost is None:
+            self._cost = evaluate_cost(self.beverage)
+        return self._cost
+
+
 if __name__ == '__main__':
     # let's run the coffee shop
 
@@ -150,3 +271,16 @@ if __name__ == '__main__':
     beverage3 = Mocha(beverage3)
     beverage3 = Whip(beverage3)
     print("{}: ${:.2f}".format(beverage3.get_description(), beverage3.cost()))
+
+    # customer four orders the same thing all day, so compile it
+    beverage4 = CompiledBeverage(Mocha(Soy(Espresso())))
+    print("{}: ${:.2f}".format(beverage4.get_description(), beverage4.cost()))
+    beverage4.wrap(Whip)
+    print("{}: ${:.2f}".format(beverage4.get_description(), beverage4.cost()))
+
+    # condiments with their own pricing compile to the same cost and description
+    beverage5 = Whip(DoubleMocha(Espresso()))
+    compiled5 = CompiledBeverage(beverage5)
+    if (compiled5.cost(), compiled5.get_description()) != (beverage5.cost(), beverage5.get_description()):
+        raise AssertionError('compiled beverage does not match the beverage')
+    print("{}: ${:.2f}".format(compiled5.get_description(), compiled5.cost()))